@@ -6,34 +6,46 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy.linalg import solve_triangular, lstsq
 
 ## functions on a given interval
-# the non-zero functions on a given interval
-f = [lambda _: 1, lambda x: x, lambda x: x**2, lambda x: x**3, lambda x: x**4]
+# the non-zero functions on a given interval are the powers of mu: 1, mu, mu^2, mu^3, mu^4;
 # the number of non-zero functions on a given interval
-n = len(f)
-# zero functions on a given interval
-fz = [lambda _: 0] * n
+n = 5
 
 ## the values of mu in Castelli and Kurucz 2004, reversed
 mu_arr = np.array([0.01, 0.025, 0.05, 0.075, 0.1, 0.125, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.])
 
 # the boundaries for the intervals of the fit: [0, x0], [x0, x1], ... [x(n), 1]
 muB_arr = np.array([])
+# a copy of the mu array for which the model below was computed; 
+# the mu array above may be replaced, e.g. for other atmosphere grids
+mu_arr_model = np.array([])
 # the number of intervals
 m = 0	
 # mu array split into a list of arrays according to the boundaries
 mu_arr_split = np.array([])
-# all the functions on each interval
-F = []
+# indices of the mu values on each interval in the mu array
+mu_ind_split = []
 # the model for the given complete set of mu values
 x = []
+# the model split into its blocks on each interval: 
+# the mu values on an interval only involve the functions on that interval
+x_split = []
+# QR decomposition of the model on each interval, None if the block is rank-deficient
+xQ = []
+xR = []
 
 # sets the array of boundary values between mu intervals
-# then splits the array of mu values accordingly, then computes all the functions on all the intervals
-# and the linear model (without coefficients) for all the given mu values
+# then splits the array of mu values accordingly, then computes
+# the linear model (without coefficients) for all the given mu values
 def set_muB(b):
-	global muB_arr, m, mu_arr_split, F, x
+	global muB_arr, mu_arr_model, m, mu_arr_split, mu_ind_split, x, x_split, xQ, xR
+	# everything below only depends on the boundaries and the mu array, 
+	# so if the model was already computed for both, we are done
+	if m > 0 and np.array_equal(muB_arr[1:], b) and np.array_equal(mu_arr_model, mu_arr):
+		return
+	mu_arr_model = np.array(mu_arr)
 	# set the array of boundaries, including the left edge of the lowest interval
 	muB_arr = np.array([0] + b)
 	# set the number of intervals
@@ -44,60 +56,138 @@ def set_muB(b):
 	# include the boundaries twice, both in the interval on the left and the interval on the right
 	for i in range(m - 1):
 		mu_arr_split[i] = np.append(mu_arr_split[i], mu_arr_split[i + 1][0])
-	# compute all the functions on each interval
+	# locate the mu values on each interval in the mu array, so that the intensities 
+	# on each interval can be picked out of an intensity array in one step
+	mu_ind_split = [np.searchsorted(mu_arr, mu_i) for mu_i in mu_arr_split]
+	## compute the model for the given complete set of mu values;
+	# each value of mu gets a row with the powers of mu in the columns of its interval's functions
+	# and zeros in the columns of the other intervals' functions;
+	# the fits on different intervals are independent, so also keep the model's 
+	# small blocks, one for each interval
+	x = np.zeros( (sum(len(mu_i) for mu_i in mu_arr_split), m * n) )
+	x_split = []
+	xQ = []
+	xR = []
+	row = 0
 	for i in range(m):
-		F.append(fz * i + f + fz * (m - i - 1))
-	## compute the model for the given complete set of mu values
-	# stack the column obtained from applying to each value of mu all the functions 
-	# on that value's interval
-	xl = []
-	for i in range(m): # interval
-		Fi = F[i] # all functions on this interval
-		for mu in mu_arr_split[i]: # mu on this interval
-			xj = [func(mu) for func in Fi]
-			xl.append(np.array(xj))
-	x = np.array(xl)
+		rows = len(mu_arr_split[i])
+		xi = np.vander(mu_arr_split[i], n, increasing=True)
+		x[row:row + rows, i * n:(i + 1) * n] = xi
+		x_split.append(xi)
+		row += rows
+		# decompose each block once, so that each fit only needs a triangular solve;
+		# if the interval contains fewer mu values than there are functions,
+		# the block is rank-deficient and the fits use least squares instead
+		if np.linalg.matrix_rank(xi) == n:
+			Q, R = np.linalg.qr(xi)
+		else:
+			Q, R = None, None
+		xQ.append(Q)
+		xR.append(R)
 
-# initialize an object of this class with an array of intensities corresponding to the array 
-# of mu values in this module and the wavelength, log g and temperature of this fit;
-# compute the fit
+# compute the fits for an array of intensities corresponding to the array 
+# of mu values in this module (last dimension), at one or more combinations of wavelength, 
+# log g and temperature (first dimension, if present);
+# all the fits share the model, so they are computed together
 def fit(I_arr):
-	# for the linear algebra fit,
-	# duplicate the intensity values at the boundaries of mu intervals
-	I_arr_dup = np.copy(I_arr)
-	ind = len(I_arr_dup) - 1
-	for i in reversed(range(m - 1)):
-		sub_ind = len(mu_arr_split[i + 1]) - 1
-		ind -= sub_ind
-		I_arr_dup = np.insert(I_arr_dup, ind, I_arr_dup[ind])
-	# fit
-	alpha = np.linalg.lstsq(x, I_arr_dup, rcond=None)[0]
-	return alpha
+	# fit on each interval
+	alpha = []
+	for i in range(m):
+		# the intensities on this interval, including those at the boundaries with neighboring intervals,
+		# with the intensities of different fits in different columns
+		I_i = I_arr[..., mu_ind_split[i]].T
+		# neither solver checks for finite values: a fit with NaN intensities gets NaN parameters,
+		# which are caught downstream, while the other fits are unaffected
+		if xR[i] is None:
+			# minimum-norm least squares via a complete orthogonal factorization, cheaper than an SVD
+			alpha.append( lstsq(x_split[i], I_i, lapack_driver='gelsy', check_finite=False)[0] )
+		else:
+			alpha.append( solve_triangular(xR[i], np.dot(xQ[i].T, I_i), check_finite=False) )
+	return np.concatenate(alpha).T
 
-# output: a 2D array of intensity values (location x wavelength)
-# inputs: a 1D array of mu values (corresponding to locations)
-# 	a 2D array of fit parameters for some band/filter (location x parameter index)
+# output: an array of intensity values, one for each location
+# inputs: an array of mu values (corresponding to locations)
+# 	an array of fit parameters for some band/filter (location x parameter index);
+#	the location dimensions of the two arrays should broadcast against each other
 # note: mu has to be in [0, 1]
 def I(mu, p):
-	# 2D array of functions evaluated at different locations
-	# 0: location
-	# 1: function
-	f_mu = np.transpose( np.array([ np.ones_like(mu), mu, mu**2, mu**3, mu**4]) )
-	# 1D array of lowest interval indices where each mu value is found,
+	mu = np.asarray(mu)
+	# array of lowest interval indices where each mu value is found,
 	# each interval of the form [mu1, mu2]
-	# 0: location
-	i = np.searchsorted(muB_arr, mu, side='right') - 1 
+	i = np.searchsorted(muB_arr, mu, side='right') - 1
 	# reshape the parameter array to distinguish between functions on different intervals
-	sh = p.shape
-	# 0: location
-	# 1: interval
-	# 2: function
-	params = p.reshape( (sh[0], m, n) )
-	# at each location, in the corresponding interval, 
-	# sum up the product of fit parameters and functions of mu
-	output = np.sum(f_mu * params[ np.arange(sh[0]), i, : ], axis=-1)
+	# ...: location
+	# -2: interval
+	# -1: function
+	params = p.reshape( p.shape[:-1] + (m, n) )
+	# pad the location dimensions of both arrays, so that they broadcast against each other
+	nd = max(i.ndim, params.ndim - 2)
+	params = params.reshape( (1,) * (nd - params.ndim + 2) + params.shape )
+	i = i.reshape( (1,) * (nd - i.ndim) + i.shape + (1, 1) )
+	# at each location, the fit parameters on the corresponding interval
+	# ...: location
+	# -1: function
+	c = np.take_along_axis(params, i, axis=-2)[..., 0, :]
+	# at each location, evaluate the polynomial in mu with Horner's method
+	output = c[..., n - 1]
+	for k in reversed(range(n - 1)):
+		output = output * mu + c[..., k]
 	return output
 
+# phi in terms of mu
+def phi(mu, a, b):
+	cosn = (mu - b) / a
+	return np.arccos(cosn)
+# indefinite integrals of the non-zero fit functions as functions of phi,
+# w.r.t. phi on interval i, given the evaluated elliptic integral; 
+# these vanish at phi = 0;
+# this function should be modified if the fit functions change
+def intgrt(phi, a, b):
+	# sine and cosine of phi
+	sine = np.sin(phi)
+	cosn = np.cos(phi)
+	# sines and cosines of multiples of phi, from the multiple-angle formulas
+	sinsq = sine * sine
+	cos2 = 1 - 2 * sinsq
+	sin2 = 2 * sine * cosn
+	sin3 = sine * (3 - 4 * sinsq)
+	sin4 = 2 * sin2 * cos2
+	sin5 = sine * (5 - 20 * sinsq + 16 * sinsq * sinsq)
+	# powers of a and b, and their products, shared by the integrals
+	a2 = a * a
+	a3 = a2 * a
+	a4 = a2 * a2
+	a5 = a4 * a
+	b2 = b * b
+	b3 = b2 * b
+	b4 = b2 * b2
+	b5 = b4 * b
+	ab = a * b
+	ab2 = a * b2
+	ab3 = a * b3
+	ab4 = a * b4
+	a2b = a2 * b
+	a2b2 = a2 * b2
+	a2b3 = a2 * b3
+	a3b = a3 * b
+	a3b2 = a3 * b2
+	a4b = a4 * b
+	# integral of the polynomial
+	integr = [
+		b*phi + a*sine,
+		(a2/2. + b2)*phi + (2*ab + (a2*cosn)/2.)*sine,
+		((3*a2b)/2. + b3)*phi + ((5*a3)/6. + 3*ab2 + \
+			(3*a2b*cosn)/2. + (a3*cos2)/6.)*sine,
+		((3*a4)/8. + 3*a2b2 + b4)*phi + (3*a3b + 4*ab3)*sine + \
+			(a4/4. + (3*a2b2)/2.)*sin2 + (a3b*sin3)/3. + (a4*sin4)/32.,
+		((15*a4b)/8. + 5*a2b3 + b5)*phi + \
+			((5*a5)/8. + (15*a3b2)/2. + 5*ab4)*sine + \
+			((5*a4b)/4. + (5*a2b3)/2.)*sin2 + \
+			((5*a5)/48. + (5*a3b2)/6.)*sin3 + \
+			(5*a4b*sin4)/32. + (a5*sin5)/80.
+	]
+	return np.transpose( np.array(integr) )
+
 # For each function of the fit on each mu interval of the fit, 
 # 	computes twice the integral of the function on the intersection of the interval 
 # 	and the integration boundaries on mu
@@ -105,37 +195,6 @@ def I(mu, p):
 #	a boolean saying whether the integration is *not* for all values of phi in [-pi, pi]
 # Output: an array of integrated functions, one for each function on each mu interval
 def integrate(belowZ1, a, b):
-	# phi in terms of mu
-	def phi(mu, a, b):
-		cosn = (mu - b) / a
-		return np.arccos(cosn)
-	# indefinite integrals of the non-zero fit functions as functions of phi,
-	# w.r.t. phi on interval i, given the evaluated elliptic integral; 
-	# this function should be modified if the fit functions change
-	def intgrt(phi, a, b):
-		# cosine phi
-		cosn = np.cos(phi)
-		cos2 = np.cos(2*phi)
-		sine = np.sin(phi)
-		sin2 = np.sin(2*phi)
-		sin3 = np.sin(3*phi)
-		sin4 = np.sin(4*phi)
-		sin5 = np.sin(5*phi)
-		# integral of the polynomial
-		integr = [
-			b*phi + a*sine,
-			(a**2/2. + b**2)*phi + (2*a*b + (a**2*cosn)/2.)*sine,
-			((3*a**2*b)/2. + b**3)*phi + ((5*a**3)/6. + 3*a*b**2 + \
-				(3*a**2*b*cosn)/2. + (a**3*cos2)/6.)*sine,
-			((3*a**4)/8. + 3*a**2*b**2 + b**4)*phi + (3*a**3*b + 4*a*b**3)*sine + \
-				(a**4/4. + (3*a**2*b**2)/2.)*sin2 + (a**3*b*sin3)/3. + (a**4*sin4)/32.,
-			((15*a**4*b)/8. + 5*a**2*b**3 + b**5)*phi + \
-				((5*a**5)/8. + (15*a**3*b**2)/2. + 5*a*b**4)*sine + \
-				((5*a**4*b)/4. + (5*a**2*b**3)/2.)*sin2 + \
-				(5*a**5*sin3)/48. + (5*a**3*b**2*sin3)/6. + \
-				(5*a**4*b*sin4)/32. + (a**5*sin5)/80.
-		]
-		return np.transpose( np.array(integr) )
 	# upper bound on integration w.r.t. mu; mu will decrease
 	mu1 = a + b
 	# indices of the mu intervals that contain the upper mu integration bound;
@@ -150,14 +209,17 @@ def integrate(belowZ1, a, b):
 	## record the integrals at the locations where a = 0
 	# if we are looking at the star pole-on, mu doesn't change as phi changes,
 	# so we integrate from zero to pi in the current (and only) mu interval
-	result_azero = intgrt(np.pi, a[~anz], b[~anz]) - intgrt(0, a[~anz], b[~anz])
+	result_azero = intgrt(np.pi, a[~anz], b[~anz])
 	# set the results at a = 0
 	result[ ~anz, i[~anz], : ] = result_azero
 	### everything below is done for the locations where a != 0
 	## when a != 0, mu changes as phi changes, 
 	## so we will keep track of whether we enter different mu intervals.
-	# lower bound on integration w.r.t. phi; phi will increase
-	ph = np.zeros_like(a)
+	# indefinite integrals at the lower bound on integration w.r.t. phi; phi will increase
+	# from zero, where the indefinite integrals are zero;
+	# these are kept from one mu interval to the next, so that each value of phi 
+	# where the integrals change intervals is only evaluated once
+	int_ph = np.zeros( a.shape + (n,) )
 	# the lower bound on integration w.r.t. mu, between 0 and 1;
 	# when integrating over phi between -pi and pi, this lower bound is some number above zero,
 	# otherwise it is zero
@@ -166,36 +228,35 @@ def integrate(belowZ1, a, b):
 	# the corresponding upper bound on integration w.r.t. phi, between 0 and pi
 	phi_mu0 = np.full_like(a, np.pi)
 	phi_mu0[  belowZ1 & anz ] = phi( 0, a[ belowZ1 & anz ], b[ belowZ1 & anz ] )
-	# lower endpoint of the current mu interval
-	mu_int = muB_arr[ i ]
-	# initialize a mask that filters for the locations
-	# where the lower endpoint of the current mu interval 
-	# is higher than the lower mu integration bound
-	mask = (mu_int > mu0) & anz
+	# indices of the locations where the lower endpoint of the current mu interval 
+	# is higher than the lower mu integration bound; only these locations are 
+	# gathered on each pass, and the index array shrinks as the locations drop out
+	act = np.nonzero( (muB_arr[ i ] > mu0) & anz )[0]
 	# where the lower endpoints of current mu intervals are higher 
 	# than the lower integration bound, integrate to the values of phi corresponding
 	# to these lower endpoints
-	while np.any(mask):
+	while act.size > 0:
+		a_act = a[act]
+		b_act = b[act]
+		i_act = i[act]
 		# phi corresponding to the lower endpoint of the current mu intervals
-		phi_int = phi(mu_int[mask], a[mask], b[mask])
+		phi_int = phi(muB_arr[ i_act ], a_act, b_act)
+		# indefinite integrals at these values of phi
+		int_int = intgrt(phi_int, a_act, b_act)
 		# compute the integrals on these intervals, from the current values of phi 
 		# to those corresponding to the lower endpoints of the current mu intervals
-		result[ mask, i[mask], : ] += \
-			intgrt(phi_int, a[mask], b[mask]) - intgrt(ph[mask], a[mask], b[mask])
-		# update the current values of phi, only leave the values
-		# where the lower endpoints of the current mu intervals are higher than the
-		# lower mu integration bounds
-		ph[mask] = np.copy(phi_int)
+		result[ act, i_act, : ] += int_int - int_ph[act]
+		# update the indefinite integrals at the current values of phi
+		int_ph[act] = int_int
 		# move one interval to the left
-		i[mask] -= 1
-		# update the lower endpoints of the current intervals
-		mu_int[mask] = muB_arr[ i[mask] ]
-		# update the mask telling us where the lower endpoint of the current mu interval 
-		# is higher than the lower mu integration bound;
-		mask &= (mu_int > mu0)
+		i_act -= 1
+		i[act] = i_act
+		# keep the locations where the lower endpoint of the new current mu interval 
+		# is still higher than the lower mu integration bound
+		act = act[ muB_arr[ i_act ] > mu0[act] ]
 	# compute the integrals on the remaining parts of the last intervals
 	# for all the locations with non-zero a
-	result[ anz, i[anz], : ] += intgrt(phi_mu0[anz], a[anz], b[anz]) - intgrt(ph[anz], a[anz], b[anz])
+	result[ anz, i[anz], : ] += intgrt(phi_mu0[anz], a[anz], b[anz]) - int_ph[anz]
 	# flatten the interval and function dimensions into a single dimension
 	sh = result.shape
 	result = result.reshape( sh[0], sh[1] * sh[2] )
@@ -119,6 +119,7 @@ class LimbDark:
     #   array of intensities on a grid of [wavelength][mu][log gravity][temperature]
     #   list of files with band transmission curves and flux zero points (photometry mode)
     #   optional set of reddening coefficients A_V, equal to zero if no reddening
+    #   optional interpolation of the transmission curves: 'cubic' or 'linear'
     # Fields modified:
     #   reddening coefficients: (av0, av1, ..., avm)
     #   band names:             (b0, b1, ..., bn)
@@ -128,7 +129,7 @@ class LimbDark:
     #   intensity array, on a grid of [band x reddening][mu][log gravity][temperature],
     #       where the first dimension corresponds to pairs 
     #       (b0, av0), (b0, av1), ..., (b0, avm), (b1, av0), ..., (bn, avm)
-    def filter(self, I, filtfiles, a_v=[0]):
+    def filter(self, I, filtfiles, a_v=[0], kind='cubic'):
         anum = len(a_v) # number of A_V values
         bands = [] # band names
         F0 = [] # flux zero points
@@ -155,7 +156,7 @@ class LimbDark:
             # intensities in erg cm^-2 s^-1 nm^-1 ster^-1, 
             # with the wavelength dimension filtered out; reddened
             for a in a_v:
-                Iband.append( ut.filter(I, T, wlf, a) )
+                Iband.append( ut.filter(I, T, wlf, a, kind) )
         I = np.array( Iband ) # a filtered intensity at each band
 
         self.a_v = np.array(a_v) # record the reddening coefficients
@@ -191,7 +192,7 @@ class LimbDark:
         self.fit_params = \
             np.full( (n_temp, n_g, n_wl, n_param), np.nan, dtype=np.float32 ) 
         
-        # for each combination of wavelength, gravity and temperature, calculate the fit at these values; 
+        # for each combination of gravity and temperature, calculate the fits at all wavelengths; 
         # record the fit parameters in the array needed for interpolation
         
         print ("Computing fits of intensity versus mu. ")
@@ -202,15 +203,9 @@ class LimbDark:
             sys.stdout.flush()
             for ind_temp in np.arange(n_temp):
                 if not np.isnan(I[0, 0, ind_g, ind_temp]):
-                    fp = np.empty( (n_wl, n_param) )
-                    for ind_wl in np.arange(n_wl):
-                        I_slice = I[ind_wl, :, ind_g, ind_temp] # get the intensities at different mus
-                        wl = self.lam[ind_wl]
-                        g = self.g[ind_g]
-                        temp = self.T[ind_temp]
-                        # fit and record the fit parameters in the array that is later used by interpolation
-                        fp[ind_wl] = ft.fit(I_slice)
-                    self.fit_params[ind_temp][ind_g] = fp
+                    I_slice = I[:, :, ind_g, ind_temp] # get the intensities at different wavelengths and mus
+                    # fit and record the fit parameters in the array that is later used by interpolation
+                    self.fit_params[ind_temp][ind_g] = ft.fit(I_slice)
         end = time.time()
         print("Done in " + str(end - start) + " seconds")
         sys.stdout.flush()
\ No newline at end of file
@@ -44,6 +44,8 @@ class Star:
 			self.a_v = ld.a_v
 			self.wavelengths = ld.lam # wavelengths
 			self.bounds = ld.bounds # the bounds between mu intervals in intensity fits
+			# set the bounds between mu intervals in intensity fits
+			ft.set_muB(self.bounds)
 		self.luminosity = luminosity
 		self.mass = mass
 		self.Req = Req # equatorial radius, in solar radii
@@ -51,8 +53,8 @@ class Star:
 		# information about the surface shape of the star and its inclination
 		self.surface = sf.Surface(omega)
 		# an additive constant for log g and a multiplicative constant for Teff
-		add_logg = math.log10(ut.G * ut.Msun / ut.Rsun**2) + math.log10(mass) - 2 * math.log10(Req)
-		mult_temp = ut.Tsun * Req**(-0.5) * luminosity**(0.25)
+		add_logg = ut.log_gsun + math.log10(mass) - 2 * math.log10(Req)
+		mult_temp = ut.Tsun * math.sqrt( math.sqrt(luminosity) / Req )
 		# map of gravity, temperature, intensity fit parameters 
 		# and other features across the surface of the star
 		self.map = mp.Map(self.surface, nz, add_logg, mult_temp, ld, temp_method, g_method, nm)
@@ -63,6 +65,12 @@ class Star:
 	# uses the integration formulas from Numerical Recipes from sections 4.1.1 - 4.1.4
 	# also allows a modified midpoint rule.
 	def integrate(self, inclination, method='cubic'):
+		return self.integrate_many([inclination], method)[0]
+
+	# for a number of inclinations, integrate as above; 
+	# the quantities that don't depend on the inclination are only computed once
+	# output: an array of the results of integrate(), one row for each inclination
+	def integrate_many(self, inclinations, method='cubic'):
 		# produce the integrand for the longitudinal direction; to do so,
 		# integrate in the azimuthal direction and multiply by area element
 		def integrand(z, z1, a, A):
@@ -74,18 +82,16 @@ class Star:
 			# a 2D array of fit function integrals, one for each combination of z value and an index that
 			# combines interval and fit function
 			P = ft.integrate(belowZ1, a_mu, b_mu)
-			# at each z value and wavelength, obtain the integral of the total fit function over phi;
-			# to do this, sum up the products of the fit parameters and the corresponding fit integrals
-			# along the fit parameter dimension
-			# 0: z
-			# 1: wavelength
-			int_phi = np.sum(a * P[:, np.newaxis, :], axis=2)
 			# obtain the integrand to integrate in the z dimension:
-			# at each z and each wavelength, obtain the product of the phi integral of the fit function and
-			# the dimensionless area element
+			# at each z and each wavelength, obtain the product of the integral of the total fit function 
+			# over phi and the dimensionless area element;
+			# to do this, multiply the fit integrals by the area element, which is cheap because
+			# there are few of them, then sum up the products of the fit parameters and the 
+			# resulting fit integrals along the fit parameter dimension, 
+			# without forming the products as a separate array
 			# 0: z
 			# 1: wavelength
-			f = A[:, np.newaxis] * int_phi
+			f = np.einsum('ijk,ik->ij', a, A[:, np.newaxis] * P)
 			return f
 
 		# fetch the surface and the map
@@ -96,87 +102,100 @@ class Star:
 		a_up = mapp.params_up
 		A_up = mapp.A_up
 		dz = mapp.dz
-		# convert to the data for the lower half of the star
-		z_dn = -1 * np.flip(z_up)
-		a_dn = np.flip(a_up, axis=0)
-		A_dn = np.flip(A_up)
-		# set the inclination of the surface
-		surf.set_inclination(inclination)
-		# get the integration bound for this surface and inclination
-		z1 = surf.z1
-		# mask the locations below the lower boundary
-		m = (z_dn >= -z1)
-		z_dn = z_dn[m]
-		a_dn = a_dn[m]
-		A_dn = A_dn[m]
-		# set the bounds between mu intervals in intensity fits
+		nz_up = len(z_up)
+		# make sure the bounds between mu intervals in intensity fits are set to this star's,
+		# in case another star's have been set since this one was created
 		ft.set_muB(self.bounds)
-		# initialize the output
-		result = np.zeros( len(self.wavelengths) )
-
-		## integrate the upper half, from z = 0 to z = 1
-		f = integrand(z_up, z1, a_up, A_up) # the integrand
-		# weights
-		wts = np.ones(f.shape[0], dtype=np.float)
+		# weights for the upper half
+		wts_up = np.ones(len(z_up), dtype=float)
 		if method == 'cubic': 
 			# set the weights according to 4.1.14 in Numerical recipes
-			wts[ [0, 1, 2] ] = wts[ [-1, -2, -3] ] = [3./8, 7./6, 23./24]
+			wts_up[ [0, 1, 2] ] = wts_up[ [-1, -2, -3] ] = [3./8, 7./6, 23./24]
 		elif method == 'trapezoid':
-			wts[0]	= wts[-1] = 0.5
-		# sum up the product of the integrand and the weights
-		result += dz * np.sum(wts[:, np.newaxis] * f, axis=0)
+			wts_up[0]	= wts_up[-1] = 0.5
+		# initialize the output
+		result = np.zeros( (len(inclinations), len(self.wavelengths)) )
+
+		for k, inclination in enumerate(inclinations):
+			# the output at this inclination
+			res = result[k]
+			# set the inclination of the surface
+			surf.set_inclination(inclination)
+			# get the integration bound for this surface and inclination
+			z1 = surf.z1
+			# the lower half of the star mirrors the upper half, so its data is that of the upper half
+			# at the opposite z; leave out the locations below the lower boundary, i.e. those with
+			# z > z1 in the upper half, which are at the end of the upper half arrays
+			# z is equally spaced in the upper half, so the number of the remaining locations 
+			# follows from the spacing, up to round-off, which is then corrected
+			n_dn = min(int(z1 / dz) + 1, nz_up)
+			if n_dn < nz_up and z_up[n_dn] <= z1:
+				n_dn += 1
+			elif z_up[n_dn - 1] > z1:
+				n_dn -= 1
+			# z in the lower half, increasing
+			z_dn = -1 * np.flip(z_up[:n_dn])
+
+			## integrate the upper half, from z = 0 to z = 1
+			f = integrand(z_up, z1, a_up, A_up) # the integrand
+			# sum up the product of the integrand and the weights, as a vector-matrix product
+			res += dz * np.dot(wts_up, f)
 
-		## integrate the lower half, from z = -z_b to z = 0
-		# the integrand; 
-		# we will often use just the first index, resulting in 1D arrays in the wavelength dimension
-		# 0: z
-		# 1: wavelength
-		f = integrand(z_dn, z1, a_dn, A_dn) 
-		# number of integrand values
-		nzd = len(z_dn) 
-		# initialize all weights to 1
-		wts = np.ones(f.shape[0], dtype=np.float) 
-		if method == 'trapezoid':
-			wts[-1] = 0.5
-			result += dz * np.sum(wts[:, np.newaxis] * f, axis=0)
-		elif method == 'cubic':
-			# the difference between the lowest z and the lower integration bound
-			d = z_dn[0] + z1
-			# if this difference is not zero and there are at least two integrand values
-			if d != 0 and nzd > 1:
-				# compute the coefficients of the quadratic through (-z1, 0) and
-				# the first two integrand values, shifted horizontally to go through (0, 0)
-				a = ( -f[0] / d 			+ f[1] / (d + dz) ) 	/ dz
-				b = ( f[0] * (d + dz) / d 	- f[1] * d / (d + dz) ) / dz
+			## integrate the lower half, from z = -z_b to z = 0
+			# the integrand; 
+			# 0: z
+			# 1: wavelength
+			# the integrand is computed in the order of the upper half data, so that the large
+			# fit parameter array is read through a contiguous view, then flipped to increasing z
+			f = np.flip( integrand(-1 * z_up[:n_dn], z1, a_up[:n_dn], A_up[:n_dn]), axis=0 )
+			# number of integrand values
+			nzd = len(z_dn) 
+			# the integral is the sum of the products of the integrand values and these weights
+			wts = np.zeros(nzd)
+			if method == 'trapezoid':
+				wts[:] = dz
+				wts[-1] = 0.5 * dz
+				res += np.dot(wts, f)
+			elif method == 'cubic':
+				# the difference between the lowest z and the lower integration bound
+				d = z_dn[0] + z1
+				# the weights of the first two integrand values in the integral from -z1 to -z1 + x
+				# of the quadratic through (-z1, 0) and these two values; this integral is linear 
+				# in the two values, because so are the coefficients of the quadratic
+				def quad_wts(x):
+					return np.array([ (-x**3 / (3 * d) + (d + dz) * x**2 / (2 * d)) / dz, \
+						(x**3 / (3 * (d + dz)) - d * x**2 / (2 * (d + dz))) / dz ])
 
-			if nzd == 1: # one integrand value
-				# a linear approximation for the entire integral between -z1 and 0
-				result += 0.5 * d * f[0]
-			elif nzd == 2: # two integrand values
-				if d != 0:
-					# the quadratic approximation of the entire integral
-					result += (a / 3) * z1**3 + (b / 2) * z1**2
-				else:
-					# a linear approximation, different inputs than above
-					result += 0.5 * dz * f[1]
-			else: # at least three integrand values
-				if d != 0:
-					# the quadratic approximation for the integral up to the first z
-					result += (a / 3) * d**3 + (b / 2) * d**2
-				# plus a closed formula for the integral between the first and the last z
-				if nzd == 3:
-					# regular 3-point Simpson's rule
-					result += dz * (f[0] + 4. * f[1] + f[2]) / 3
-				elif nzd == 4:
-					# Simpson's 3/8 rule
-					result += dz * (3 * f[0] + 9 * f[1] + 9 * f[2] + 3 * f[3]) / 8
-				elif nzd == 5:
-					# Bode's rule
-					result += dz * (14 * f[0] + 64 * f[1] + 24 * f[2] + 64 * f[3] + 14 * f[4]) / 45
-				else: # at least 6 integrand values
-					# 4.1.14 in Numerical Recipes
-					wts[ [0, 1, 2] ] = wts[ [-1, -2, -3] ] = [3./8, 7./6, 23./24]
-					result += dz * np.sum(wts[:, np.newaxis] * f, axis=0)
+				if nzd == 1: # one integrand value
+					# a linear approximation for the entire integral between -z1 and 0
+					wts[0] = 0.5 * d
+				elif nzd == 2: # two integrand values
+					if d != 0:
+						# the quadratic approximation of the entire integral
+						wts += quad_wts(z1)
+					else:
+						# a linear approximation, different inputs than above
+						wts[1] = 0.5 * dz
+				else: # at least three integrand values
+					if d != 0:
+						# the quadratic approximation for the integral up to the first z
+						wts[:2] += quad_wts(d)
+					# plus a closed formula for the integral between the first and the last z
+					if nzd == 3:
+						# regular 3-point Simpson's rule
+						wts += dz * np.array([1., 4., 1.]) / 3
+					elif nzd == 4:
+						# Simpson's 3/8 rule
+						wts += dz * np.array([3., 9., 9., 3.]) / 8
+					elif nzd == 5:
+						# Bode's rule
+						wts += dz * np.array([14., 64., 24., 64., 14.]) / 45
+					else: # at least 6 integrand values
+						# 4.1.14 in Numerical Recipes
+						nr = np.ones(nzd)
+						nr[ [0, 1, 2] ] = nr[ [-1, -2, -3] ] = [3./8, 7./6, 23./24]
+						wts += dz * nr
+				res += np.dot(wts, f)
 
 		# convert from Req^2 to cm^2 (area of the star)
 		# and from per steradian to per cm^2 (area of the photodetector)
@@ -1,5 +1,6 @@
 import numpy as np
 import math
+import functools
 from scipy import interpolate
 
 # functions that provide the volume and the surface area of a star 
@@ -15,15 +16,20 @@ omax = None # maximum value of Omega / sqrt(G M / R^3)
 
 def calcVA():
 	def T(w, u):
+		u2 = u * u
+		u4 = u2 * u2
+		w2 = w * w
+		uw = u2 + w
 		return np.arccos(\
-			(27. - 2*u**6 - 54*w - 6*u**4*w + 27*w**2 - 6*u**2*w**2 - 2*w**3) / \
-			(2.*(u**2 + w)**3))
+			(27. - 2*u4*u2 - 54*w - 6*u4*w + 27*w2 - 6*u2*w2 - 2*w2*w) / \
+			(2.*uw*uw*uw))
 
 	def vfunc(w, u):
 		return np.cos((1./3) * (2 * np.pi + T(w, u)))
 
 	def S(w, u, v):
-		return (1. / 3) * (2*w - u**2 + 2 * (u**2 + w) * v)
+		u2 = u * u
+		return (1. / 3) * (2*w - u2 + 2 * (u2 + w) * v)
 
 	def Ds(w, u, v):
 	 	return 2. * u * (1 - 2 * v) / (3 + 6 * v)
@@ -101,6 +107,33 @@ def calcom():
 	global omega
 	omega = interpolate.interp1d(otc, om, kind='cubic')
 
+# output: u at the integration bound on z
+# inputs: w of a rotating star, tangent of the inclination, which should not be zero;
+# stars with the same rotation are usually integrated at the same inclinations, so the results are cached
+@functools.lru_cache(maxsize=1024)
+def U1(w, tani):
+	## solve for s at the integration bound
+	Tsq = tani**2
+	# coefficients of the polynomial
+	p = np.array([
+		-1 - Tsq, \
+		6*(1 + Tsq)*w, \
+		-15*(1 + Tsq)*w**2, \
+		1 - 2*w + w**2 + 20*w**3 + 4*Tsq*(-1 + 2*w - w**2 + 5*w**3), \
+		-(w*(4 - 8*w + 4*w**2 + 15*w**3 + 3*Tsq*(-4 + 8*w - 4*w**2 + 5*w**3))), \
+		6*w**2*(1 - 2*w + w**2 + w**3 + Tsq*(-2 + 4*w - 2*w**2 + w**3)), \
+		-(Tsq*(-2 + 4*w - 2*w**2 + w**3)**2) - w**3*(4 - 8*w + 4*w**2 + w**3), \
+		(-1 + w)**2*w**4
+	])
+	# roots of the polynomial equation
+	rts = np.roots(p)
+	# find the root that's between zero and one
+	condition = ((0 <= rts) & (rts <= 1)) 
+	s = np.real(np.extract(condition, rts)[0])
+	# now find the value of u at this s
+	u = math.sqrt(-(((-1 + s)*(s + s**2 + (-1 + w)**2 - 2*s*w))/(s - w)**2))
+	return u
+
 class Surface:
 	""" Contains all the information pertaining to the surface of a rotating star,
 	as defined by a Roche potential that combines gravitational and rotational effects.
@@ -124,6 +157,13 @@ class Surface:
 		self.inclination = inclination
 		self.sini = math.sin(inclination)
 		self.cosi = math.cos(inclination)
+		# tangent and secant of the inclination, used by the sightline and integration bound computations
+		if self.cosi == 0:
+			self.tani = np.inf
+			self.seci = np.inf
+		else:
+			self.tani = self.sini / self.cosi
+			self.seci = 1 / self.cosi
 		self.z1 = self.Z1()
 
 	## conversions between z and a related variable
@@ -135,43 +175,60 @@ class Surface:
 	## helper functions for computing r(z) and its derivative 
 	def T(self, u):
 		w = self.w
+		u2 = u * u
+		u4 = u2 * u2
+		w2 = w * w
+		uw = u2 + w
 		return np.arccos(\
-			(27. - 2*u**6 - 54*w - 6*u**4*w + 27*w**2 - 6*u**2*w**2 - 2*w**3) / \
-			(2.*(u**2 + w)**3))
+			(27. - 2*u4*u2 - 54*w - 6*u4*w + 27*w2 - 6*u2*w2 - 2*w2*w) / \
+			(2.*uw*uw*uw))
 	def V(self, u):
 		return np.cos((1./3) * (2 * np.pi + self.T(u))) 
 	# s(u)
 	def S(self, u):
 		w = self.w
+		u2 = u * u
 		if np.isinf(w):
-			return 1 - u**2
+			return 1 - u2
 		else:
-			return (1. / 3) * (2*w - u**2 + 2 * (u**2 + w) * self.V(u))
+			return (1. / 3) * (2*w - u2 + 2 * (u2 + w) * self.V(u))
 	# derivative of s(u)
 	def Ds(self, u):
 		w = self.w
 		if np.isinf(w):
 			return -2 * u
 		else:
-			return 2. * u * (1 - 2 * self.V(u)) / (3 + 6 * self.V(u))
+			v = self.V(u)
+			return 2. * u * (1 - 2 * v) / (3 + 6 * v)
+	# s(u) and its derivative, sharing the evaluation of v(u)
+	def SDs(self, u):
+		w = self.w
+		u2 = u * u
+		if np.isinf(w):
+			return [1 - u2, -2 * u]
+		else:
+			v = self.V(u)
+			s = (1. / 3) * (2*w - u2 + 2 * (u2 + w) * v)
+			ds = 2. * u * (1 - 2 * v) / (3 + 6 * v)
+			return [s, ds]
 
 	## r(z) and its derivative
-	def R(self, z):
-		s = self.S(self.U(z))
+	# r(z), given the values of s(u) at these z
+	def Rs(self, z, s):
 		# we may get a negative number at z = 1 or -1,
 		# due to limited precision; set r = 0 there
-		if np.isscalar(z):
-			if np.abs(z) == 1:
-				s = 0
-		else:
-			s[ np.abs(z) == 1 ] = 0
+		s = np.where(np.abs(z) == 1, 0., s)
 		# square root
 		output = np.sqrt(s)
 		return output
 
+	def R(self, z):
+		return self.Rs(z, self.S(self.U(z)))
+
 	def Drz(self, z):
-		numerator = self.Ds(self.U(z))
-		denominator = (2. * self.f * self.R(z))
+		s, ds = self.SDs(self.U(z))
+		numerator = ds
+		denominator = (2. * self.f * self.Rs(z, s))
 		return numerator / denominator
 
 	# output: the differential element of area in the units of equatorial radius squared
@@ -179,7 +236,8 @@ class Surface:
 	# 	the differential element of z
 	# input: z
 	def A(self, z):
-		return (1./self.f) * np.sqrt(self.S(self.U(z)) + self.Ds(self.U(z))**2 / 4)
+		s, ds = self.SDs(self.U(z))
+		return (1./self.f) * np.sqrt(s + ds**2 / 4)
 
 	# coefficients in the expression mu = a * cos(phi) + b
 	def ab(self, z):
@@ -207,7 +265,7 @@ class Surface:
 		elif z == -self.z1:
 			return 1
 		else:
-			return self.f * self.Drz(z) * self.cosi / self.sini
+			return self.f * self.Drz(z) / self.tani
 
 	# output: spherical coordinate rho 
 	# inputs: sets of r and z values
@@ -232,34 +290,13 @@ class Surface:
 	def Z1(self):
 		w = self.w
 		sini = self.sini
-		cosi = self.cosi
 		if np.isinf(w):
 			return sini
 		elif sini == 0:
 			return 0
 		else:
-			## solve for s at the integration bound
-			Tsq = (sini / cosi)**2
-			# coefficients of the polynomial
-			p = np.array([
-				-1 - Tsq, \
-				6*(1 + Tsq)*w, \
-				-15*(1 + Tsq)*w**2, \
-				1 - 2*w + w**2 + 20*w**3 + 4*Tsq*(-1 + 2*w - w**2 + 5*w**3), \
-				-(w*(4 - 8*w + 4*w**2 + 15*w**3 + 3*Tsq*(-4 + 8*w - 4*w**2 + 5*w**3))), \
-				6*w**2*(1 - 2*w + w**2 + w**3 + Tsq*(-2 + 4*w - 2*w**2 + w**3)), \
-				-(Tsq*(-2 + 4*w - 2*w**2 + w**3)**2) - w**3*(4 - 8*w + 4*w**2 + w**3), \
-				(-1 + w)**2*w**4
-			])
-			# roots of the polynomial equation
-			rts = np.roots(p)
-			# find the root that's between zero and one
-			condition = ((0 <= rts) & (rts <= 1)) 
-			s = np.real(np.extract(condition, rts)[0])
-			# now find the value of u at this s
-			u = math.sqrt(-(((-1 + s)*(s + s**2 + (-1 + w)**2 - 2*s*w))/(s - w)**2))
-			# finally, obtain the bound on z
-			return self.Z(u)
+			# obtain the bound on z from the bound on u
+			return self.Z(U1(w, self.tani))
 
 	## functions related to the projection of the stellar surface
 	## onto the view plane, whose coordinates are y and u-prime, both normalized by Req
@@ -290,48 +327,87 @@ class Surface:
 			omega = self.omega
 			o2 = omega**2
 			o4 = omega**4
-			s = 1 / self.cosi
-			t = np.tan(self.inclination)
-			c2 = np.cos(2 * self.inclination)
-			c4 = np.cos(4 * self.inclination)		
-			# compute the u value at each point on the line
-			for i in range(len(up_arr)):
-				up = up_arr[i]
-				y = y_arr[i]
-				# coefficients of the 6th degree polynomial in u
-				p = np.array([
-					(o4*t**4*(1 + t**2))/4.,
-					-(o4*s*t**3*(2 + 3*t**2)*up)/2.,
-					(t**2*(-2*o4 - 2*o4*t**2 - 4*o2*(1 + t**2)))/4. + \
-						(t**2*(6*o4*s**2 + 15*o4*s**2*t**2)*up**2)/4. + \
-						(t**2*(2*o4 + 3*o4*t**2)*y**2)/4.,
-					s*t*(-(o4*s**2) -5*o4*s**2*t**2)*up**3 +\
-						up*(s*t*(o4 + 2*o4*t**2 + o2*(2 + 4*t**2)) + s*t*(-o4 - 3*o4*t**2)*y**2),
-					1 + o2 + o4/4. + t**2 + o2*t**2 + (o4*t**2)/4. + \
-						((o4*s**4)/4. + (15*o4*s**4*t**2)/4.)*up**4 + \
-						(-o2 - o4/2. - 2*o2*t**2 - o4*t**2)*y**2 + (o4/4. + (3*o4*t**2)/4.)*y**4 +\
-						up**2*(-(o2*s**2) - (o4*s**2)/2. - 6*o2*s**2*t**2 - 3*o4*s**2*t**2 +\
-						((o4*s**2)/2. + (9*o4*s**2*t**2)/2.)*y**2),
-					(-3*o4*s**5*t*up**5)/2. + up**3*(-(s*(-8*o2*s**2 - 4*o4*s**2)*t)/2. - 3*o4*s**3*t*y**2) +\
-						up*(-((4 + 4*o2 + o4)*s*t)/2. - ((-8*o2 - 4*o4)*s*t*y**2)/2. - (3*o4*s*t*y**4)/2.),
-					-1 + (o4*s**6*up**6)/4. + ((4 + 4*o2 + o4)*y**2)/4. + ((-4*o2 - 2*o4)*y**4)/4. +\
-						(o4*y**6)/4. + up**4*((-4*o2*s**4 - 2*o4*s**4)/4. + (3*o4*s**4*y**2)/4.) +\
-						up**2*((4*s**2 + 4*o2*s**2 + o4*s**2)/4. + ((-8*o2*s**2 - 4*o4*s**2)*y**2)/4. +\
-						(3*o4*s**2*y**4)/4.)
-				])
-				# roots of the polynomial equation
-				rts = np.roots(p)
-				# real roots
-				u = rts[np.isreal(rts)]
-				# r that solves both the surface equation and the projected ellipse equation
-				# is one of the two values that solves the latter
-				r = np.sqrt(y**2 + (up - u*self.sini)**2/self.cosi**2)
-				# filter the combinations of u and r that are within their domains
-				ok = (np.abs(u) < 1 / self.f)*(np.abs(r) < 1) != 0
-				u = u[ok]
-				r = r[ok]
-				# if the line of sight intersects with the star's surface
-				if u.size == 2:
-					# record the larger u value for use in spectrum calculations
-					u_arr[i] = np.max(u)
+			s = self.seci
+			t = self.tani
+			## constant factors in the coefficients of the 6th degree polynomial in u;
+			## these depend only on the rotation and the inclination
+			# coefficient of u^6
+			c6 = (o4*t**4*(1 + t**2))/4.
+			# coefficient of u^5
+			c5_up = -(o4*s*t**3*(2 + 3*t**2))/2.
+			# coefficient of u^4
+			c4_1 = (t**2*(-2*o4 - 2*o4*t**2 - 4*o2*(1 + t**2)))/4.
+			c4_up2 = (t**2*(6*o4*s**2 + 15*o4*s**2*t**2))/4.
+			c4_y2 = (t**2*(2*o4 + 3*o4*t**2))/4.
+			# coefficient of u^3
+			c3_up3 = s*t*(-(o4*s**2) -5*o4*s**2*t**2)
+			c3_up = s*t*(o4 + 2*o4*t**2 + o2*(2 + 4*t**2))
+			c3_upy2 = s*t*(-o4 - 3*o4*t**2)
+			# coefficient of u^2
+			c2_1 = 1 + o2 + o4/4. + t**2 + o2*t**2 + (o4*t**2)/4.
+			c2_up4 = (o4*s**4)/4. + (15*o4*s**4*t**2)/4.
+			c2_y2 = -o2 - o4/2. - 2*o2*t**2 - o4*t**2
+			c2_y4 = o4/4. + (3*o4*t**2)/4.
+			c2_up2 = -(o2*s**2) - (o4*s**2)/2. - 6*o2*s**2*t**2 - 3*o4*s**2*t**2
+			c2_up2y2 = (o4*s**2)/2. + (9*o4*s**2*t**2)/2.
+			# coefficient of u
+			c1_up5 = (-3*o4*s**5*t)/2.
+			c1_up3 = -(s*(-8*o2*s**2 - 4*o4*s**2)*t)/2.
+			c1_up3y2 = -3*o4*s**3*t
+			c1_up = -((4 + 4*o2 + o4)*s*t)/2.
+			c1_upy2 = -((-8*o2 - 4*o4)*s*t)/2.
+			c1_upy4 = -(3*o4*s*t)/2.
+			# constant coefficient
+			c0_up6 = (o4*s**6)/4.
+			c0_y2 = (4 + 4*o2 + o4)/4.
+			c0_y4 = (-4*o2 - 2*o4)/4.
+			c0_y6 = o4/4.
+			c0_up4 = (-4*o2*s**4 - 2*o4*s**4)/4.
+			c0_up4y2 = (3*o4*s**4)/4.
+			c0_up2 = (4*s**2 + 4*o2*s**2 + o4*s**2)/4.
+			c0_up2y2 = (-8*o2*s**2 - 4*o4*s**2)/4.
+			c0_up2y4 = (3*o4*s**2)/4.
+			# all sightlines at once
+			up = up_arr
+			y = y_arr
+			# powers of the view plane coordinates
+			up2 = up * up
+			up3 = up2 * up
+			up4 = up2 * up2
+			y2 = y * y
+			y4 = y2 * y2
+			# coefficients of the 6th degree polynomial in u, one row for each sightline
+			p = np.stack([
+				np.full_like(up, c6),
+				c5_up*up,
+				c4_1 + c4_up2*up2 + c4_y2*y2,
+				c3_up3*up3 + up*(c3_up + c3_upy2*y2),
+				c2_1 + c2_up4*up4 + c2_y2*y2 + c2_y4*y4 + up2*(c2_up2 + c2_up2y2*y2),
+				c1_up5*up4*up + up3*(c1_up3 + c1_up3y2*y2) + up*(c1_up + c1_upy2*y2 + c1_upy4*y4),
+				-1 + c0_up6*up4*up2 + c0_y2*y2 + c0_y4*y4 + c0_y6*y4*y2 + up4*(c0_up4 + c0_up4y2*y2) +\
+					up2*(c0_up2 + c0_up2y2*y2 + c0_up2y4*y4)
+			], axis=-1)
+			# the leading coefficients are the same for all sightlines; 
+			# remove those that are zero, e.g. when the star doesn't rotate, to get the degree of the polynomial
+			p = p[:, np.argmax(np.any(p != 0, axis=0)):]
+			deg = p.shape[1] - 1
+			# companion matrices of the polynomials, one for each sightline
+			cm = np.zeros( (len(up), deg, deg) )
+			cm[:, 0, :] = -p[:, 1:] / p[:, :1]
+			cm[:, np.arange(1, deg), np.arange(deg - 1)] = 1
+			# roots of the polynomial equations, as the eigenvalues of the companion matrices
+			rts = np.linalg.eigvals(cm)
+			# real roots
+			real = np.isreal(rts)
+			u = np.real(rts)
+			# r that solves both the surface equation and the projected ellipse equation
+			# is one of the two values that solves the latter
+			dup = (up[:, np.newaxis] - u*self.sini)*s
+			r = np.sqrt(y2[:, np.newaxis] + dup*dup)
+			# filter the combinations of u and r that are within their domains
+			ok = real & (np.abs(u) < 1 / self.f) & (np.abs(r) < 1)
+			# the sightlines that intersect with the star's surface
+			mask = np.count_nonzero(ok, axis=1) == 2
+			# record the larger u value for use in spectrum calculations
+			u_arr[mask] = np.max(np.where(ok, u, -np.inf), axis=1)[mask]
 		return u_arr
\ No newline at end of file
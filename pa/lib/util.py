@@ -1,8 +1,9 @@
 # Generally useful functions. Uses cgs units unless specified otherwise.
 import math
 import sys
+import functools
 import numpy as np
-from scipy.interpolate import interp1d
+from scipy.interpolate import CubicSpline
 
 ### physical constants
 Lsun = 3.839e33 # solar luminosity in erg/s
@@ -12,14 +13,21 @@ Rsun = 6.9551e10 # solar radius in cm
 sigma = 5.6704e-5 # Stefan-Boltzmann constant in erg*cm**-2*s**-1*K**-4
 sigma_sun = sigma * Rsun**2 / Lsun # Stephan-Boltzmann constant in Lsun * Rsun^-2 * K^-4
 c = 2.99792458e10 # speed of light in cm/s
+c_nm = 1.e7 * c # speed of light in nm per second
+cA = 1.e8 * c # speed of light in angstroms per second
 h = 6.62606885e-27 # planck's constant in erg*s
 k = 1.3806504e-16 # Boltzmann constant in erg/K
 D10 = 3.085678e+19 # ten parsecs in cm
 Tsun = (Lsun / (4*math.pi*sigma*Rsun**2))**(0.25) # temperature of the Sun in Kelvins
+gsun = G * Msun / Rsun**2 # surface gravity of the Sun in cm/s^2
+log_gsun = math.log10(gsun) # log surface gravity of the Sun
 Zsun = 0.01886 # from Anders and Grevesse, 1989, Geochimica et Cosmochimica Acta, Volume 53, Issue 1, p. 197-214 (used by http://kurucz.harvard.edu/grids/gridm01/)
 # Zsun = 0.017 # from Grevesse, N., & Sauval, A. J., 1998, Space Sci. Rev., 85, 161 (used by Castelli and Kurucz 2004)
 Zsun_mist = 0.0142 # bulk solar metallicity from Asplund et al, Annu. Rev. Astron. Astrophys. 2009. 47:481–522 (used by MIST)
 
+# converts magnitudes of extinction to the exponent in the natural exponential of the attenuation
+mag_exp = math.log(10) / 2.5
+
 # printf() function from O'Reilly's Python Cookbook
 def printf(format, *args):
 	sys.stdout.write(format % args)
@@ -39,7 +47,7 @@ def dist(mod):
 # Keplerian limit on the angular velocity, 
 # for fixed mass in solar masses and equatorial radius in solar radii
 def OmegaK(M, Req):
-	return np.sqrt(G * M * Msun / (Req * Rsun)**3)
+	return np.sqrt(gsun / Rsun * M / Req**3)
 
 ## Conversions between dimensionless omegas in the context of a Roche model;
 ## see appendix in arXiv:1505.03997
@@ -74,18 +82,19 @@ def area(L, Teff):
 # pseudo effective temperature in Kelvin
 # from luminosity in solar luminosities and equatorial radius in solar radii
 def tau(L, Req):
-	return ( L * Lsun / (4 * np.pi * sigma * (Req * Rsun)**2) )**(1./4)
+	return Tsun * np.sqrt( np.sqrt(L) / Req )
 # luminosity in solar luminosities
 # from pseudo effective temperature in Kelvin and equatorial radius in solar radii
 def L(tau, Req):
-	return 4 * np.pi * (Req * Rsun)**2 * sigma * tau**4 / Lsun
+	t2 = (tau / Tsun)**2
+	return Req**2 * t2 * t2
 
 # log pseudo effective gravity
 def gamma(M, Req):
-	return np.log10( G * M * Msun / (Req * Rsun)**2 )
+	return np.log10( gsun * M / Req**2 )
 # mass in solar masses
 def M(gamma, Req):
-	return 10**gamma * (Req * Rsun)**2 / (G * Msun)
+	return 10**gamma * Req**2 / gsun
 
 # convert between absolute metallicity Z and logarithmic relative metallicity [M/H],
 # as well as between these variables for different solar metallicities
@@ -102,7 +111,7 @@ def logZp_from_logZm(logZ):
 
 # v sin i from mass
 def vsini1(M, R, omega, inc):
-	return omega * np.sqrt(G * M * Msun / (R * Rsun)) * np.sin(inc)
+	return omega * np.sqrt(gsun * Rsun * M / R) * np.sin(inc)
 # v sin i from gamma
 def vsini(gamma, R, omega, inc):
 	return omega * np.sqrt(10**gamma * R * Rsun) * np.sin(inc) 
@@ -111,10 +120,13 @@ def vsini(gamma, R, omega, inc):
 # insert n-1 equally spaced values between every two neighbors;
 # this makes a grid of size N_0 * n - (n - 1), where N_0 is the original grid size.
 def refine(grid, factor):
-	newgrid = np.array([])
-	for i in range(len(grid) - 1):
-		newgrid = np.append(newgrid, np.linspace(grid[i], grid[i + 1], factor + 1))
-	newgrid = np.unique(newgrid)
+	grid = np.asarray(grid, dtype=float)
+	# steps between neighbors in the new grid, one row for each pair of neighbors
+	step = np.diff(grid)[:, np.newaxis] / factor
+	# the left neighbor of each pair, followed by the inserted values, as in np.linspace
+	newgrid = grid[:-1, np.newaxis] + np.arange(factor) * step
+	# tack on the right end of the original grid
+	newgrid = np.concatenate( (newgrid.ravel(), grid[-1:]) )
 	return newgrid
 
 ### Wavelength / frequency conversions
@@ -122,7 +134,6 @@ def refine(grid, factor):
 # inputs: an array of wavelengths in nanometers
 # output: an array of frequencies in Hz
 def color_nm_Hz(wl):
-	c_nm = 1.e7 * c # speed of light in nm per second
 	return c_nm / wl
 
 ### intensity / flux conversions
@@ -131,7 +142,6 @@ def color_nm_Hz(wl):
 # 	an array of corresponding wavelengths in Angstroms
 # output: an array of the same quantity per Hertz of frequency
 def A_to_Hz(f_arr, wl_arr):
-	cA = 1.e8 * c # speed of light in angstroms per second
 	return f_arr * wl_arr**2 / cA
 
 # inputs: an array of some quantity per Hz of frequency 
@@ -139,36 +149,51 @@ def A_to_Hz(f_arr, wl_arr):
 # 	an array of corresponding wavelengths in nanometers
 # output: an array of the same quantity per Angstrom of wavelength
 def Hz_to_A(x, wl):
-	cA = 1.e8 * c # speed of light in angstroms per second
-	wl_A = 1.e1 * wl # wavelengths in angstroms
-	return x * cA / wl_A**2
+	# the conversion of the wavelengths from nm to angstroms is folded into the constant
+	return x * (cA / 1.e2) / wl**2
 
 # inputs: an array of some quantity per nanometer of wavelength, 
 # 	an array of corresponding wavelengths in nanometers
 # output: an array of the same quantity per Hertz of frequency
 def nm_to_Hz(f_arr, wl_arr):
-	c_nm = 1.e7 * c # speed of light in nm per second
 	return f_arr * wl_arr**2 / c_nm
 
 # inputs: an array of some quantity per Hz of frequency, 
 # 	an array of corresponding wavelengths in nanometers
 # output: an array of the same quantity per nm of wavelength
 def Hz_to_nm(f_arr, wl_arr):
-	c_nm = 1.e7 * c # speed of light in nm per second
 	return f_arr * c_nm / wl_arr**2
 
 # array of wavelengths for filtering, reddening, intensity conversions, etc.
 lam = np.array([])
 # array of (A_lambda / A_V) for these wavelengths
 AlamV = np.array([])
+# the R_V reddening parameter and the reddening model of this array
+AlamV_args = None
 
 # set wavelengths
 # Input: wavelength array in nm
 def setlam(l):
 	global lam
-	lam = l # set the global wavelength array
+	# (A_lambda / A_V) only depends on the wavelengths and the reddening parameters, so there is 
+	# nothing to do if they are the same as the ones already set, e.g. for another metallicity
+	if AlamV_args == (3.1, 'f99') and len(AlamV) == len(l) and np.array_equal(lam, l):
+		return
+	lam = np.array(l) # set the global wavelength array, as a copy so that the check above is meaningful
 	alamv() # set the global (A_lambda / A_V) array
 
+# output: a cubic spline based on a filter
+# inputs: the bytes of the filter's transmission curve and wavelengths, as double-precision arrays;
+# the same filter is usually applied at several reddening coefficients, so the splines are cached
+# note: the spline is nan outside the filter's wavelengths
+@functools.lru_cache(maxsize=8)
+def filter_spline(trans, wlf):
+	wlf = np.frombuffer(wlf)
+	trans = np.frombuffer(trans)
+	# the spline needs increasing wavelengths
+	ind = np.argsort(wlf)
+	return CubicSpline(wlf[ind], trans[ind], extrapolate=False)
+
 # integrate intensity (last dimension is wavelength) 
 # convolved with the transmission curve and, optionally, the reddening curve, 
 # normalize by the integral of the transmission curve
@@ -176,27 +201,43 @@ def setlam(l):
 # 	transmission curve 
 #	filter wavelengths in nm
 #	reddening coefficient A_V: zero if no reddening, infinity if no light gets past the dust
+#	optional interpolation of the transmission curve: 'cubic' or 'linear', 
+#		the latter is faster and suits densely sampled transmission curves
 # Output: intensities in erg cm^-2 s^-1 nm^-1 ster^-1, with the wavelength dimension filtered out
 #	and the reddening dimension added as the first dimension
-def filter(I, trans, wlf, a_v):
-	# a cubic spline based on the filter
-	Tfunc = interp1d(wlf, trans, kind='cubic', bounds_error=False, fill_value=0)
-	# evaluate the transmission curve at the light's wavelengths
-	T = Tfunc(lam)
-	# convert intensity from per Hz to per nm
-	I = Hz_to_nm(I, lam)
-	# calculate the differences between light's wavelengths
-	diff = np.diff(lam)
-	## estimate the integral using the trapezoidal rule with variable argument differentials
+def filter(I, trans, wlf, a_v, kind='cubic'):
+	# evaluate the transmission curve at the light's wavelengths, 
+	# setting it to zero outside the filter's wavelengths
+	if kind == 'linear':
+		ind = np.argsort(wlf)
+		T = np.interp(lam, wlf[ind], trans[ind], left=0, right=0)
+	elif kind == 'cubic':
+		# a cubic spline based on the filter
+		Tfunc = filter_spline(np.asarray(trans, dtype=float).tobytes(), np.asarray(wlf, dtype=float).tobytes())
+		T = np.nan_to_num( Tfunc(lam) )
+	else:
+		raise ValueError('Transmission curve interpolation %s not implemented.' % (kind))
+	# attenuation due to reddening, 10^(-A_lambda / 2.5), if there is any
+	if a_v == 0:
+		atten = 1
+	else:
+		atten = np.exp( -a_v * AlamV * mag_exp )
+	# weights at the light's wavelengths: transmission times attenuation, 
+	# including the conversion of intensity from per Hz to per nm;
+	# these are combined once, so that the intensity array is only multiplied once
+	wts = Hz_to_nm(T * atten, lam)
+	## estimate the integrals using the trapezoidal rule with variable argument differentials
 	# array of averaged differentials
+	diff = np.diff(lam)
 	d = 0.5 * ( np.append(diff, 0) + np.insert(diff, 0, 0) )
-	# approximation of the integral, flux integrated over wavelengths
-	intensity = np.sum( d * I * T * 10**(-1 * a_v * AlamV / 2.5), axis=-1 )
+	# approximation of the integral, flux integrated over wavelengths;
+	# the differentials are folded into the weights, so that this is a single pass over the intensities
+	intensity = np.dot( I, wts * d )
 	# where intensity is not zero or nan, normalize by the integral of the transmission curve
 	output = np.empty_like(intensity)
 	mask = np.logical_or( intensity == 0, np.isnan(intensity) )
 	output[ mask ] = intensity[ mask ]
-	output[ ~mask ] = intensity[ ~mask ] / np.sum( d * T )
+	output[ ~mask ] = intensity[ ~mask ] / np.dot( T, d )
 	return output
 
 # Inputs: an array of wavelengths in angstroms
@@ -206,7 +247,7 @@ def filter(I, trans, wlf, a_v):
 # Adapted from: f99.py
 def alamv(r_v=3.1, model='f99'):
 
-	global AlamV
+	global AlamV, AlamV_args
 
 	# convert wavelengths to Angstroms, then to inverse wavelength units
 	x = 1.e4 / np.ravel(lam * 10) 
@@ -225,25 +266,24 @@ def alamv(r_v=3.1, model='f99'):
 
 	# UV region
 	y = x[uv_region]
+	y2 = y * y
 	if model == 'f99':
 		x0, gamma = 4.596, 0.99
 		c3, c4, c5 = 3.23, 0.41, 5.9
 		c2 = -0.824 + 4.717 / r_v
 		c1 = 2.030 - 3.007 * c2
-		d = y**2 / ((y**2 - x0**2)**2 + y**2 * gamma**2)
-		f = np.zeros_like(y)
-		valid = (y >= c5)
-		f[valid] = 0.5392 * (y[valid] - c5)**2 + 0.05644 * (y[valid] - c5)**3
+		d = y2 / ((y2 - x0**2)**2 + y2 * gamma**2)
+		# the far-UV curvature term is only present above c5
+		yc = y - c5
+		f = np.where(y >= c5, (0.5392 + 0.05644 * yc) * yc * yc, 0.)
 		k_uv = c1 + c2 * y + c3 * d + c4 * f
 	if model == 'fm07':
 		x0, gamma = 4.592, 0.922
 		c1, c2, c3, c4, c5 = -0.175, 0.807, 2.991, 0.319, 6.097
-		D = y**2 / ((y**2-x0**2)**2 + y**2 * gamma**2)
-		k_uv = np.zeros_like(y)
-		valid = (y <= c5)
-		k_uv[valid] = c1 + c2*y[valid] + c3*D[valid]
-		valid = (y > c5)
-		k_uv[valid] = c1 + c2*y[valid] + c3*D[valid] + c4*(y[valid] - c5)**2
+		D = y2 / ((y2 - x0**2)**2 + y2 * gamma**2)
+		# the far-UV curvature term is only present above c5
+		yc = y - c5
+		k_uv = c1 + c2*y + c3*D + np.where(y > c5, c4 * yc * yc, 0.)
 	k[uv_region] = k_uv
 
 	# Calculate values for UV spline points to anchor OIR fit
@@ -273,7 +313,8 @@ def alamv(r_v=3.1, model='f99'):
 		anchors_x = np.append(anchors_x, x_uv_spline)
 		anchors_k = np.append(anchors_extinction - r_v, k_uv_spline)
 
-	oir_spline = interp1d(anchors_x, anchors_k, kind='cubic')
+	oir_spline = CubicSpline(anchors_x, anchors_k)
 	k[oir_region] = oir_spline(y)
 
-	AlamV = k / r_v + 1
\ No newline at end of file
+	AlamV = k / r_v + 1
+	AlamV_args = (r_v, model)
\ No newline at end of file
@@ -34,12 +34,11 @@ def computemag(z, l, limb, L, tau, omega, inc, M, Z, av, bands):
 			try:
 				# pre-calculate inclination-independent quantities
 				st = star.Star(omega[o], L[l], M[m], 1, ut.D10, 100, ld=limb)
-				for i in np.arange(len(inc)):
-					# calculate the magnitudes at this inclination;
-					# these should be a 1D array, corresponding to bands and reddenings as follows:
-					# (b0, av0), (b0, av1), ..., (b0, avm), (b1, av0), ..., (bn, avm)
-					mags = st.integrate(inc[i])
-					result[o, i, m, :, :] = mags.reshape(len(bands), len(av))
+				# calculate the magnitudes at all the inclinations;
+				# at each inclination, these should be a 1D array, corresponding to bands and reddenings as follows:
+				# (b0, av0), (b0, av1), ..., (b0, avm), (b1, av0), ..., (bn, avm)
+				mags = st.integrate_many(inc)
+				result[o, :, m, :, :] = mags.reshape(len(inc), len(bands), len(av))
 			except mp.InterpolationError as err:
 				pass
 	print('.', end='', flush=True)
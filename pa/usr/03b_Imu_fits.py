@@ -14,20 +14,16 @@ import pa.lib.fit as ft
 import matplotlib.pyplot as plt
 from matplotlib import rc
 
-# given an array of mu, returns an array of p-functions for each mu:
-# 0: mu 
-# 1: p_i
-def pi(mu):
-	return np.transpose(np.array([ np.ones_like(mu), mu, mu**2, mu**3, mu**4]))
-
 # points for plots
-# inputs: a_ij, I, index of location in I, indices of m_j, p_ij
-def Iplot(a, I, ii, im, p):
-	aa = a[ tuple(ii) ][im, :]
-	Ifit = np.sum(aa * p, axis=-1)
-	Igrid = I[tuple(ii)]
-	Ifit = Ifit / Igrid[-1]
-	Igrid = Igrid / Igrid[-1]
+# inputs: a_ij, I, list of indices of locations in I, mu values
+# outputs: fit and grid intensities at each location, normalized by the grid intensity at mu = 1
+def Iplot(a, I, ii, x):
+	ii = tuple( np.array(ii).T )
+	# evaluate the fits at all the locations together
+	Ifit = ft.I(x, a[ ii ][:, np.newaxis, :])
+	Igrid = I[ii]
+	Ifit = Ifit / Igrid[:, -1:]
+	Igrid = Igrid / Igrid[:, -1:]
 	return Ifit, Igrid
 
 iodir = '../../' # location of the input/output directory
@@ -53,19 +49,12 @@ ider = np.unravel_index(np.argmin(Im[..., 3]), Im[..., 3].shape)
 
 # set the mu partition
 ft.set_muB(bounds)
-# a_ij coefficients: (61, 11, 1221, 3, 5) = (temperature, gravity, wavelength, interval, function)
-a = a.reshape( (sh[0], sh[1], sh[2], ft.m, ft.n) ) 
 
 # 17 mu
 mu = ft.mu_arr 
-# functions at 17 mu: 2D
-p = pi(mu)
-# intervals where 17 mu are found
-i = np.searchsorted(ft.muB_arr, mu, side='right') - 1 
-# at each location, in the corresponding interval, for each wavelength, 
-# sum up the product of fit parameters and functions of mu
-# (61, 11, 1221, 17, 5) -> (61, 11, 1221, 17) = (temperature, gravity, wavelength, mu)
-Ifit = np.sum(a[ ..., i, : ] * p[ np.newaxis, np.newaxis, np.newaxis, :, : ], axis=-1)
+# at each location, for each wavelength, evaluate the fit at 17 mu
+# (61, 11, 1221, 17) = (temperature, gravity, wavelength, mu)
+Ifit = ft.I(mu, a[ ..., np.newaxis, : ])
 
 # permute the dimensions of CK04 intensity grid: (61, 11, 1221, 17) = (temperature, gravity, wavelength, mu)
 I = np.transpose(I, axes=[3, 2, 0, 1])
@@ -89,15 +78,9 @@ imed = np.array(np.unravel_index(np.argsort(dist, axis=None), dist.shape))
 
 # mu values to plot
 x = np.linspace(0, 1, 100)
-# p values to plot
-px = pi(x)
-# intervals
-i = np.searchsorted(ft.muB_arr, x, side='right') - 1 
 # intensities
-Imaxfit, Imax = Iplot(a, I, imax, i, px)
-Imedfit, Imed = Iplot(a, I, imed[:, 0], i, px)
-Iminfit, Imin = Iplot(a, I, imin, i, px)
-Iderfit, Ider = Iplot(a, I, ider, i, px)
+(Imaxfit, Imedfit, Iminfit, Iderfit), (Imax, Imed, Imin, Ider) = \
+	Iplot(a, I, [imax, imed[:, 0], imin, ider], x)
 
 # print relevant values
 print('Maximum error is ' + str(maxerr))
@@ -28,14 +28,9 @@ iobs = 0.08683
 # create star
 star = st.Star(omega, luminosity, mass, Req, distance, n_z, ld) 
 # compute its magnitudes at both filters at all inclinations
-V = []
-B = []
-for i in incs:
-	mags = star.integrate(i)
-	V.append( mags[iV] )
-	B.append( mags[iB] )
-V = np.array(V)
-B = np.array(B)
+mags = star.integrate_many(incs)
+V = mags[:, iV]
+B = mags[:, iB]
 # colors
 color = B - V
 # compute the observed values